@@ -3,8 +3,10 @@
 import json
 import math
 import os
+import functools
 import bpy
 from . import utilities, validations, settings, ingest, extension, io
+from .utilities import orjson
 from ..constants import BlenderTypes, UnrealTypes, FileTypes, PreFixToken, ToolInfo, ExtensionTasks
 from . import metadata
 
@@ -28,33 +30,50 @@ def get_file_path(asset_name, properties, asset_type, lod=False, file_extension=
     )
 
 
-def export_lods(asset_id, asset_name, properties):
+def get_lod_objects(properties):
+    """
+    Groups the lod meshes in the export collection by the name of the asset they are a lod of.
+
+    :param PropertyData properties: A property data instance that contains all property values of the tool.
+    :return dict: A dictionary of asset names and their lod mesh objects, excluding lod0.
+    """
+    lod_objects = {}
+    if properties.import_lods:
+        for mesh_object in utilities.get_from_collection(BlenderTypes.MESH):
+            if mesh_object.name != utilities.get_lod0_name(mesh_object.name, properties):
+                asset_name = utilities.get_asset_name(mesh_object.name, properties)
+                lod_objects.setdefault(asset_name, []).append(mesh_object)
+    return lod_objects
+
+
+def export_lods(asset_id, asset_name, properties, lod_objects=None):
     """
     Exports the lod meshes and returns there file paths.
 
     :param str asset_id: The unique id of the asset.
     :param str asset_name: The name of the asset that will be exported to a file.
     :param PropertyData properties: A property data instance that contains all property values of the tool.
+    :param dict lod_objects: The lod mesh objects grouped by asset name. If not given they are collected.
     :return list: A list of lod file paths.
     """
     lods = {}
     if properties.import_lods:
-        mesh_objects = utilities.get_from_collection(BlenderTypes.MESH)
-        for mesh_object in mesh_objects:
-            if utilities.is_lod_of(asset_name, mesh_object.name, properties):
-                if mesh_object.name != utilities.get_lod0_name(mesh_object.name, properties):
-                    lod_index = utilities.get_lod_index(mesh_object.name, properties)
-                    asset_type = utilities.get_mesh_unreal_type(mesh_object)
-                    file_path = get_file_path(mesh_object.name, properties, asset_type, lod=True)
-                    export_mesh(asset_id, mesh_object, properties, lod=lod_index)
-                    if file_path:
-                        lods[str(lod_index)] = file_path
+        if lod_objects is None:
+            lod_objects = get_lod_objects(properties)
+
+        for mesh_object in lod_objects.get(asset_name, []):
+            lod_index = utilities.get_lod_index(mesh_object.name, properties)
+            asset_type = utilities.get_mesh_unreal_type(mesh_object)
+            file_path = get_file_path(mesh_object.name, properties, asset_type, lod=True)
+            export_mesh(asset_id, mesh_object, properties, lod=lod_index)
+            if file_path:
+                lods[str(lod_index)] = file_path
         return lods
 
 
 def set_parent_rig_selection(mesh_object, properties):
     """
-    Recursively selects all parents of an object as long as the parent are in the rig collection.
+    Selects all parents of an object as long as the parent are in the rig collection.
 
     :param object mesh_object: A object of type mesh.
     :param object properties: The property group that contains variables that maintain the addon's correct state.
@@ -62,19 +81,29 @@ def set_parent_rig_selection(mesh_object, properties):
     """
     rig_object = utilities.get_armature_modifier_rig_object(mesh_object) or mesh_object.parent
 
-    # if the scene object has a parent
-    if rig_object:
+    # get the rig collection once rather than for every parent in the hierarchy
+    skeleton_objects = set(utilities.get_from_collection(BlenderTypes.SKELETON)) if rig_object else set()
 
-        # if the scene object's parent is in the rig collection
-        if rig_object in utilities.get_from_collection(BlenderTypes.SKELETON):
-            # select the parent object
-            rig_object.select_set(True)
+    # walk up the parents while they are in the rig collection
+    parent_object = rig_object
+    while parent_object and parent_object in skeleton_objects:
+        # select the parent object
+        parent_object.select_set(True)
 
-            # call the function again to see if this object has a parent that
-            set_parent_rig_selection(rig_object, properties)
+        # then check if this object has a parent in the rig collection too
+        parent_object = utilities.get_armature_modifier_rig_object(parent_object) or parent_object.parent
     return rig_object
 
 
+# the fbx export settings that are the same for every exported file
+FBX_EXPORT_SETTINGS = {
+    'use_selection': True,
+    'bake_anim_use_nla_strips': True,
+    'bake_anim_use_all_actions': False,
+    'object_types': frozenset({'ARMATURE', 'MESH', 'EMPTY'})
+}
+
+
 def export_fbx_file(file_path, export_settings):
     """
     Exports a fbx file.
@@ -83,25 +112,12 @@ def export_fbx_file(file_path, export_settings):
     :param dict export_settings: A dictionary of blender export settings for the specific file type.
     """
     major_version = bpy.app.version[0] # type: ignore
-    
-    if major_version <= 3:
-        io.fbx_b3.export(
-            filepath=file_path,
-            use_selection=True,
-            bake_anim_use_nla_strips=True,
-            bake_anim_use_all_actions=False,
-            object_types={'ARMATURE', 'MESH', 'EMPTY'},
-            **export_settings
-        )
-    elif major_version >= 4:
-        io.fbx_b4.export(
-            filepath=file_path,
-            use_selection=True,
-            bake_anim_use_nla_strips=True,
-            bake_anim_use_all_actions=False,
-            object_types={'ARMATURE', 'MESH', 'EMPTY'},
-            **export_settings
-        )
+    fbx_io = io.fbx_b3 if major_version <= 3 else io.fbx_b4
+    fbx_io.export(
+        filepath=file_path,
+        **FBX_EXPORT_SETTINGS,
+        **export_settings
+    )
 
 
 def export_alembic_file(file_path, export_settings):
@@ -123,6 +139,21 @@ def export_alembic_file(file_path, export_settings):
     )
 
 
+def dumps_fcurve_data(fcurve_data):
+    """
+    Serializes the custom property fcurve data to json bytes.
+
+    :param dict fcurve_data: A dictionary of custom property fcurve names and points.
+    :return bytes: The ascii encoded json.
+    """
+    if orjson:
+        fcurve_json = orjson.dumps(fcurve_data)
+        # unreal reads the file with the platform's default encoding, so only ascii output is safe
+        if fcurve_json.isascii():
+            return fcurve_json
+    return json.dumps(fcurve_data, separators=(',', ':')).encode('ascii')
+
+
 def export_custom_property_fcurves(action_name, properties):
     """
     Exports custom property fcurves to a file.
@@ -131,7 +162,8 @@ def export_custom_property_fcurves(action_name, properties):
     :param object properties: The property group that contains variables that maintain the addon's correct state.
     """
     asset_id = bpy.context.window_manager.send2ue.asset_id
-    file_path = bpy.context.window_manager.send2ue.asset_data[asset_id]['file_path']
+    asset_data = bpy.context.window_manager.send2ue.asset_data[asset_id]
+    file_path = asset_data['file_path']
 
     fcurve_file_path = None
     fcurve_data = utilities.get_custom_property_fcurve_data(action_name)
@@ -139,10 +171,42 @@ def export_custom_property_fcurves(action_name, properties):
         file_path, file_extension = os.path.splitext(file_path)
         fcurve_file_path = ToolInfo.FCURVE_FILE.value.format(file_path=file_path)
         if fcurve_data:
-            with open(fcurve_file_path, 'w') as fcurves_file:
-                json.dump(fcurve_data, fcurves_file)
+            # serialize up front so the file is written in one call
+            with open(fcurve_file_path, 'wb') as fcurves_file:
+                fcurves_file.write(dumps_fcurve_data(fcurve_data))
+
+    asset_data['fcurve_file_path'] = fcurve_file_path
+
+
+@functools.lru_cache(maxsize=None)
+def get_export_setting_paths(file_type):
+    """
+    Gets the property paths of the blender export settings for the given file type. These come from the
+    static settings file, so they are cached rather than re-read from disk for every exported asset.
+
+    :param str file_type: File type of the export.
+    :return tuple: A tuple of (property prefix, attribute name) pairs.
+    """
+    setting_paths = []
+    for group_name, group_data in settings.get_settings_by_path('blender-export_method', file_type).items():
+        prefix = settings.get_generated_prefix(f'blender-export_method-{file_type}', group_name)
+        for attribute_name in group_data.keys():
+            setting_paths.append((prefix, attribute_name))
+    return tuple(setting_paths)
+
 
-    bpy.context.window_manager.send2ue.asset_data[asset_id]['fcurve_file_path'] = fcurve_file_path
+def get_export_settings(properties, file_type):
+    """
+    Gets the blender export settings for the given file type from the current property values.
+
+    :param object properties: The property group that contains variables that maintain the addon's correct state.
+    :param str file_type: File type of the export.
+    :return dict: A dictionary of blender export settings.
+    """
+    export_settings = {}
+    for prefix, attribute_name in get_export_setting_paths(file_type):
+        export_settings[attribute_name] = settings.get_property_by_path(prefix, attribute_name, properties)
+    return export_settings
 
 
 def export_file(properties, lod=0, file_type=FileTypes.FBX):
@@ -165,18 +229,14 @@ def export_file(properties, lod=0, file_type=FileTypes.FBX):
         file_path = asset_data['lods'][str(lod)]
 
     # if the folder does not exist create it
-    folder_path = os.path.abspath(os.path.join(file_path, os.pardir))
-    if not os.path.exists(folder_path):
-        os.makedirs(folder_path)
+    os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
 
     # get blender export settings
-    export_settings = {}
-    for group_name, group_data in settings.get_settings_by_path('blender-export_method', file_type).items():
-        prefix = settings.get_generated_prefix(f'blender-export_method-{file_type}', group_name)
-        for attribute_name in group_data.keys():
-            export_settings[attribute_name] = settings.get_property_by_path(prefix, attribute_name, properties)
+    export_settings = get_export_settings(properties, file_type)
 
-    metadata.assign_custom_metadata()
+    # collect the meshes once, so the metadata is removed from the same objects it was assigned to
+    mesh_objects = metadata.get_mesh_objs()
+    metadata.assign_custom_metadata(mesh_objects)
 
     if file_type == FileTypes.FBX:
         export_fbx_file(file_path, export_settings)
@@ -184,7 +244,7 @@ def export_file(properties, lod=0, file_type=FileTypes.FBX):
     elif file_type == FileTypes.ABC:
         export_alembic_file(file_path, export_settings)
         
-    metadata.delete_custom_metadata()
+    metadata.delete_custom_metadata(mesh_objects)
 
 
 def get_asset_sockets(asset_name, properties):
@@ -197,20 +257,29 @@ def get_asset_sockets(asset_name, properties):
     socket_data = {}
     mesh_object = bpy.data.objects.get(asset_name)
     if mesh_object:
+        socket_prefix = f'{PreFixToken.SOCKET.value}_'
         for child in mesh_object.children:
-            if child.type == 'EMPTY' and child.name.startswith(f'{PreFixToken.SOCKET.value}_'):
-                name = utilities.get_asset_name(child.name.replace(f'{PreFixToken.SOCKET.value}_', ''), properties)
-                relative_location = utilities.convert_blender_to_unreal_location(
-                    child.matrix_local.translation
-                )
-                relative_rotation = utilities.convert_blender_rotation_to_unreal_rotation(
-                    child.rotation_euler
-                )
-                socket_data[name] = {
-                    'relative_location': relative_location,
-                    'relative_rotation': relative_rotation,
-                    'relative_scale': child.matrix_local.to_scale()[:]
-                }
+            if child.type != 'EMPTY':
+                continue
+
+            child_name = child.name
+            if not child_name.startswith(socket_prefix):
+                continue
+
+            name = utilities.get_asset_name(child_name.replace(socket_prefix, ''), properties)
+            # matrix_local builds a new matrix on every access, so only get it once
+            matrix_local = child.matrix_local
+            relative_location = utilities.convert_blender_to_unreal_location(
+                matrix_local.translation
+            )
+            relative_rotation = utilities.convert_blender_rotation_to_unreal_rotation(
+                child.rotation_euler
+            )
+            socket_data[name] = {
+                'relative_location': relative_location,
+                'relative_rotation': relative_rotation,
+                'relative_scale': matrix_local.to_scale()[:]
+            }
     return socket_data
 
 
@@ -310,9 +379,10 @@ def export_hair(asset_id, properties):
 
     # clear animation transformations prior to export so groom exports with no distortion
     for scene_object in bpy.data.objects:
-        if scene_object.animation_data:
-            if scene_object.animation_data.action:
-                scene_object.animation_data.action = None
+        animation_data = scene_object.animation_data
+        if animation_data:
+            if animation_data.action:
+                animation_data.action = None
         utilities.set_all_action_mute_values(scene_object, mute=True)
         if scene_object.type == BlenderTypes.SKELETON:
             utilities.clear_pose(scene_object)
@@ -415,25 +485,21 @@ def create_mesh_data(mesh_objects, rig_objects, properties):
     if not properties.import_meshes:
         return mesh_data
 
-    previous_asset_names = []
+    previous_asset_names = set()
+
+    # group the lod meshes once, rather than searching every mesh for the lods of each asset
+    lod_objects = get_lod_objects(properties)
 
     # get the asset data for the scene objects
     for mesh_object in mesh_objects:
-        already_exported = False
-        asset_name = utilities.get_asset_name(mesh_object.name, properties)
-
         # only export meshes that are lod 0
         if properties.import_lods and utilities.get_lod_index(mesh_object.name, properties) != 0:
             continue
 
-        # TODO: don't think this block is needed, how would the code ever reach this block since all LODs except LOD0 are skipped?
-        # check each previous asset name for its lod mesh
-        for previous_asset in previous_asset_names:
-            if utilities.is_lod_of(previous_asset, mesh_object.name, properties):
-                already_exported = True
-                break
+        asset_name = utilities.get_asset_name(mesh_object.name, properties)
 
-        if not already_exported:
+        # skip meshes whose name resolves to an asset that was already exported, e.g. "Cube.001" and "Cube_001"
+        if asset_name not in previous_asset_names:
             asset_type = utilities.get_mesh_unreal_type(mesh_object)
             # get file path
             file_path = get_file_path(mesh_object.name, properties, asset_type, lod=False)
@@ -450,11 +516,11 @@ def create_mesh_data(mesh_objects, rig_objects, properties):
                 'asset_folder': import_path,
                 'asset_path': f'{import_path}{asset_name}',
                 'skeleton_asset_path': properties.unreal_skeleton_asset_path,
-                'lods': export_lods(asset_id, asset_name, properties),
+                'lods': export_lods(asset_id, asset_name, properties, lod_objects),
                 'sockets': get_asset_sockets(mesh_object.name, properties),
                 'skip': False
             }
-            previous_asset_names.append(asset_name)
+            previous_asset_names.add(asset_name)
 
     return mesh_data
 
@@ -506,9 +572,8 @@ def create_groom_data(hair_objects, properties):
     return groom_data
 
 def remove_image_ext(name : str) -> str:
-    for ext in list(IMAGE_EXTENSIONS.values()):
-        if name.endswith(f".{ext}"):
-            return name[:-(len(ext) + 1)]
+    if name.endswith(IMAGE_EXT_SUFFIXES):
+        return name[:name.rindex(".")]
     return name
 
 def get_image_ext(ext_enum : str) -> str:
@@ -530,14 +595,23 @@ def create_texture_data(mesh_objects, mesh_asset_data, properties):
     if not properties.import_materials_and_textures:
         return texture_data
 
-    previous_asset_names = []
-    all_images_file_paths = []
+    previous_asset_names = set()
+    # images shared between meshes are only saved once
+    all_images_file_paths = set()
+
+    # the export folder only depends on the asset type, so only resolve it once per type
+    export_folders = {}
 
     # get the asset data for the scene objects
     for mesh_object in mesh_objects:
+        # only export meshes that are lod 0
+        if properties.import_lods and utilities.get_lod_index(mesh_object.name, properties) != 0:
+            continue
+
         asset_type = utilities.get_mesh_unreal_type(mesh_object)
-        directory = utilities.get_export_folder_path(properties, asset_type)
-        already_exported = False
+        directory = export_folders.get(asset_type)
+        if directory is None:
+            directory = export_folders[asset_type] = utilities.get_export_folder_path(properties, asset_type)
         asset_name = utilities.get_asset_name(mesh_object.name, properties)
         # get mesh file path - used so asset_id corresponds to mesh
         file_path = get_file_path(mesh_object.name, properties, asset_type, lod=False)
@@ -545,21 +619,11 @@ def create_texture_data(mesh_objects, mesh_asset_data, properties):
         asset_id = utilities.get_asset_id(file_path)
         import_path = utilities.get_import_path(properties, asset_type)
         
-        materials = []
+        materials = set()
         images_file_paths = []
-        
-        # only export meshes that are lod 0
-        if properties.import_lods and utilities.get_lod_index(mesh_object.name, properties) != 0:
-            continue
-
-        # TODO: don't think this block is needed, how would the code ever reach this block since all LODs except LOD0 are skipped?
-        # check each previous asset name for its lod mesh
-        for previous_asset in previous_asset_names:
-            if utilities.is_lod_of(previous_asset, mesh_object.name, properties):
-                already_exported = True
-                break
 
-        if not already_exported:
+        # skip meshes whose name resolves to an asset that was already exported, e.g. "Cube.001" and "Cube_001"
+        if asset_name not in previous_asset_names:
             # When combine meshes is enabled, only one mesh per parent empty is processed,
             # and the rest are filtered out before we get to this point.
             # Therefore we always gather textures as if combine mesh is enabled,
@@ -572,64 +636,75 @@ def create_texture_data(mesh_objects, mesh_asset_data, properties):
                 for i in range(len(obj.material_slots)):
                     material = obj.material_slots[i].material
                     if material not in materials:
-                        materials.append(material)
+                        materials.add(material)
                         for node in material.node_tree.nodes:
+                            node_type = node.type
+                            # only group and image nodes can have textures to export
+                            if node_type != "GROUP" and node_type != "TEX_IMAGE":
+                                continue
 
                             # Handle Ucupaint group nodes
-                            if node.type == "GROUP" and node.node_tree.name.find("Ucupaint") >= 0 and node.node_tree.yp.use_baked:          
+                            if node_type == "GROUP" and UCUPAINT_TITLE in node.node_tree.name and node.node_tree.yp.use_baked:
                                 image_dict = get_baked_images(node.node_tree)
 
                                 # Save baked images
                                 for channel, image in image_dict.items():
                                     if channel in UCUPAINT_IGNORE_BAKED:
                                         continue
-                                    image_name = image.name
-                                    if image_name.startswith(f"{UCUPAINT_TITLE} "):
-                                        image_name = image_name[len(f"{UCUPAINT_TITLE} "):]
+                                    image_name = image.name.removeprefix(UCUPAINT_PREFIX)
                                     fmt = get_image_ext(image.file_format)
                                     # Remove image extension beforehand, since we dont know if name contains extension or not
                                     filepath = f"{directory}\\{remove_image_ext(image_name)}.{fmt}"
                                     if filepath not in all_images_file_paths:
                                         image.save(filepath = filepath)
-                                        all_images_file_paths.append(filepath)
+                                        all_images_file_paths.add(filepath)
                                     images_file_paths.append(filepath)
 
                             # Handle node wrangler or prefixed image nodes               
-                            if node.type == "TEX_IMAGE":
-                                if node.image and node.label in NODE_WRANGLER_TEXTURES or node.label.find(INPUT_PREFIX) == 0:
+                            if node_type == "TEX_IMAGE":
+                                # image nodes without an image have nothing to save
+                                image = node.image
+                                if image is None:
+                                    continue
+                                label = node.label
+                                if label in NODE_WRANGLER_TEXTURES or label.startswith(INPUT_PREFIX):
                                     #channel = node.label if node.label in NODE_WRANGLER_TEXTURES else node.label[len(INPUT_PREFIX):]
-                                    fmt = get_image_ext(node.image.file_format)
+                                    fmt = get_image_ext(image.file_format)
                                     # Remove image extension beforehand, since we dont know if name contains extension or not
-                                    filepath = f"{directory}\\{remove_image_ext(node.image.name)}.{fmt}"
+                                    filepath = f"{directory}\\{remove_image_ext(image.name)}.{fmt}"
                                     if filepath not in all_images_file_paths:
-                                        node.image.save(filepath = filepath)
-                                        all_images_file_paths.append(filepath)
+                                        image.save(filepath = filepath)
+                                        all_images_file_paths.add(filepath)
                                     #node.image.save(filepath = f"{directory}\\{material.name}_{channel}.{fmt}")
                                     images_file_paths.append(filepath)
 
             # save the asset data
-            mesh_asset_data[asset_id] = mesh_asset_data[asset_id] | {
+            mesh_asset_data[asset_id].update({
                 'images_file_paths': images_file_paths,
                 'image_asset_folder': import_path,
                 'skip': False
-            }
-            previous_asset_names.append(asset_name)
+            })
+            previous_asset_names.add(asset_name)
 
 def get_baked_images(node_tree : bpy.types.NodeTree) -> dict[str, bpy.types.Image]:
     image_dict = {}
     for node in node_tree.nodes:
-        if node.type == "TEX_IMAGE" and node.label[:len("Baked ")] == "Baked " and node.image:
-            image_dict[node.label[len("Baked "):]] = node.image
+        if node.type != "TEX_IMAGE":
+            continue
+        label = node.label
+        if label.startswith(BAKED_PREFIX) and node.image:
+            image_dict[label.removeprefix(BAKED_PREFIX)] = node.image
     return image_dict
     
 def get_other_images(node_tree : bpy.types.NodeTree) -> dict[str, bpy.types.Image]:
     image_dict = {}
     for node in node_tree.nodes:
         if node.type == "TEX_IMAGE" and node.image:
-            if node.label in NODE_WRANGLER_TEXTURES:
-                image_dict[node.label] = node.image
-            elif node.label.find(INPUT_PREFIX) == 0:
-                image_dict[node.label[len(INPUT_PREFIX):]] = node.image
+            label = node.label
+            if label in NODE_WRANGLER_TEXTURES:
+                image_dict[label] = node.image
+            elif label.startswith(INPUT_PREFIX):
+                image_dict[label.removeprefix(INPUT_PREFIX)] = node.image
     return image_dict
 
 def create_asset_data(properties):
@@ -1,6 +1,6 @@
 import os
 import bpy
-from ..utilities import report_error
+from ..utilities import report_error, get_fbx_addon_folder_path
 from mathutils import Vector
 from importlib.machinery import SourceFileLoader
 
@@ -16,9 +16,7 @@ def export(**keywords):
     The functions below have been tweaked from their originals here:
     https://github.com/blender/blender-addons/blob/master/io_scene_fbx/export_fbx_bin.py
     """
-    import addon_utils
-    addons = {os.path.basename(os.path.dirname(module.__file__)): module.__file__ for module in addon_utils.modules()}
-    addon_folder_path = os.path.dirname(addons.get('io_scene_fbx'))
+    addon_folder_path = get_fbx_addon_folder_path()
 
     # this load the io_scene_fbx module from the blender FBX addon
     try:
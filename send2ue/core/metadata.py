@@ -1,7 +1,9 @@
 import bpy, json
-from dataclasses import dataclass, asdict, field
-from typing import Any
+from dataclasses import dataclass, field
+from typing import Any, Callable
 from .texture_constants import *
+from ..constants import BlenderTypes, ToolInfo
+from .utilities import orjson
 
 # This creates material metadata for unreal assets. This is a specialized setup to handle Ucupaint and Node Wrangler setups.
 # https://github.com/ucupumar/ucupaint
@@ -14,210 +16,322 @@ from .texture_constants import *
 # 5. Most unconnected input sockets on the Principled BSDF node (other shader nodes not supported)
 
 METADATA_NAME = "blender_metadata"
+INPUT_PREFIX_LEN = len(INPUT_PREFIX)
+INVALID_FILENAME_TABLE = str.maketrans({c : "_" for c in INVALID_FILENAME_CHARS})
+
+# Ucupaint channel names that differ from their Principled BSDF input names
+UCUPAINT_CHANNEL_NAMES = {
+    "Color" : "Base Color",
+}
 
 def unreal_image_name(name : str) -> str:
     # remove file extension
-    for ext in list(IMAGE_EXTENSIONS.values()):
-        if name.endswith(f".{ext}"):
-            name = name[:-(len(ext) + 1)]
-    for c in INVALID_FILENAME_CHARS:
-        name = name.replace(c, "_")
-    return name
+    if name.endswith(IMAGE_EXT_SUFFIXES):
+        name = name[:name.rindex(".")]
+    return name.translate(INVALID_FILENAME_TABLE)
 
 def unreal_material_name(name : str) -> str:
-    for c in INVALID_FILENAME_CHARS:
-        name = name.replace(c, "_")
-    return name
+    return name.translate(INVALID_FILENAME_TABLE)
 
 def fix_material_name(material : bpy.types.Material):
-    material.name = unreal_material_name(material.name)
+    name = unreal_material_name(material.name)
     
-    # handle duplicate naming suffixes (ex. .001)
-    while "." in material.name:
-        material.name = unreal_material_name(material.name)
+    # handle duplicate naming suffixes (ex. .001), which blender adds if the fixed name is already taken
+    while name != material.name:
+        material.name = name
+        name = unreal_material_name(material.name)
 
 def get_baked_images(node_tree : bpy.types.NodeTree) -> dict[str, bpy.types.TextureNodeImage]:
     image_dict = {}
     for node in node_tree.nodes:
-        if node.type == "TEX_IMAGE" and node.label[:len("Baked ")] == "Baked ":
-            image_dict[node.label[len("Baked "):]] = node
+        if node.type == "TEX_IMAGE":
+            label = node.label
+            if label.startswith(BAKED_PREFIX):
+                image_dict[label.removeprefix(BAKED_PREFIX)] = node
     return image_dict
 
+# Ucupaint node trees are often shared between materials, so data read from a tree is only computed once per export.
+# Keyed by (compute function, node tree pointer). A new cache is made for each assign_custom_metadata() call,
+# so no bpy references outlive it.
+NodeTreeCache = dict[tuple[Callable, int], Any]
+
+def get_cached(tree_cache : NodeTreeCache, compute : Callable[[bpy.types.NodeTree], Any], node_tree : bpy.types.NodeTree) -> Any:
+    key = (compute, node_tree.as_pointer())
+    value = tree_cache.get(key)
+    if value is None:
+        value = compute(node_tree)
+        tree_cache[key] = value
+    return value
+
+def get_socket_links(node_tree : bpy.types.NodeTree) -> dict[bpy.types.NodeSocket, list[bpy.types.NodeSocket]]:
+    # NodeSocket.links scans every link in the tree on each access, so map output sockets to their targets in one pass
+    socket_links = {}
+    for link in node_tree.links:
+        socket_links.setdefault(link.from_socket, []).append(link.to_socket)
+    return socket_links
+
+def is_ucupaint_tree(node_tree : bpy.types.NodeTree) -> bool:
+    return UCUPAINT_TITLE in node_tree.name
+
 def default_vector():
-    return [0,0,0,0]
+    return (0,0,0,0)
 
-@dataclass
+@dataclass(slots = True)
 class ScalarInputMetadata():
     default : float = 0
     texture_name : str = ""
+    
+    def to_dict(self) -> dict[str, Any]:
+        return {"default" : self.default, "texture_name" : self.texture_name}
      
-@dataclass
+@dataclass(slots = True)
 class VectorInputMetadata():
-    default : list[float] = field(default_factory = default_vector)
+    default : tuple[float, ...] = field(default_factory = default_vector)
     texture_name : str = "" 
     
-@dataclass
+    def to_dict(self) -> dict[str, Any]:
+        return {"default" : self.default, "texture_name" : self.texture_name}
+    
+@dataclass(slots = True)
 class MaterialMetadata():
     scalar_inputs : dict[str, ScalarInputMetadata]
     vector_inputs : dict[str, VectorInputMetadata]
     
+    # Avoids asdict(), which deep copies every nested field
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "scalar_inputs" : {label : scalar_input.to_dict() for label, scalar_input in self.scalar_inputs.items()},
+            "vector_inputs" : {label : vector_input.to_dict() for label, vector_input in self.vector_inputs.items()},
+        }
+    
     @staticmethod
     def get_scalar(scalar_inputs : dict[str, ScalarInputMetadata], label : str) -> ScalarInputMetadata:
-        if label in scalar_inputs:
-            return scalar_inputs[label]
-        else:
+        scalar_input = scalar_inputs.get(label)
+        if scalar_input is None:
             scalar_input = ScalarInputMetadata()
             scalar_inputs[label] = scalar_input
-            return scalar_input
+        return scalar_input
     
     @staticmethod
     def get_vector(vector_inputs : dict[str, VectorInputMetadata], label : str) -> VectorInputMetadata:
-        if label in vector_inputs:
-            return vector_inputs[label]
-        else:
+        vector_input = vector_inputs.get(label)
+        if vector_input is None:
             vector_input = VectorInputMetadata()
             vector_inputs[label] = vector_input
-            return vector_input
+        return vector_input
     
     @staticmethod
-    def create_material_metadata(material : bpy.types.Material) -> 'MaterialMetadata':
+    def create_material_metadata(material : bpy.types.Material, tree_cache : NodeTreeCache) -> 'MaterialMetadata':
         scalar_inputs : dict[str, ScalarInputMetadata] = {}
         vector_inputs : dict[str, VectorInputMetadata] = {}
         
+        if not material.use_nodes or material.node_tree is None:
+            return MaterialMetadata(scalar_inputs, vector_inputs)
+        
+        socket_links = get_socket_links(material.node_tree)
+        
+        # Read type/label once per node, since each access goes through RNA.
+        # Unhandled nodes (reroutes, frames, math, etc.) only pay for the type lookup.
         for node in material.node_tree.nodes:
-            # Find Ucupaint group
-            if node.type == "GROUP" and node.node_tree.name.find("Ucupaint") >= 0: 
-                
-                # Handle Ucupaint channels
-                for i in range(len(node.inputs)):
-                    input = node.inputs[i]
-                    input_name = input.name if input.name != "Color" else "Base Color" # Make consistent with Principled BSDF
-                    if input.type == "RGBA" or input.type == "VECTOR":
-                        MaterialMetadata.get_vector(vector_inputs, input_name).default = list(input.default_value)
-                    elif input.type == "VALUE":
-                        MaterialMetadata.get_scalar(scalar_inputs, input_name).default = input.default_value
-                    else:
-                        print(f"Skipping input: {input_name}\n")
-                
-                if node.node_tree.yp.use_baked:
-                    # Handle Ucupaint baked images
-                    for channel, image_node in get_baked_images(node.node_tree).items():
-                        channel_name = channel if channel != "Color" else "Base Color" # Make consistent with Principled BSDF
-                        if len(image_node.outputs[0].links) > 0:
-                            socket_type = image_node.outputs[0].links[0].to_socket.type
-                            image_name = unreal_image_name(image_node.image.name[len("Ucupaint "):])
-                            if socket_type == "RGBA" or socket_type == "VECTOR":
-                                MaterialMetadata.get_vector(vector_inputs, channel_name).texture_name = image_name
-                            elif socket_type == "VALUE":
-                                MaterialMetadata.get_scalar(scalar_inputs, channel_name).texture_name = image_name
-                            else:
-                               print(f"Skipping baked image due to invalid output connection: {image_node.label}\n")
-                        else:
-                            print(f"Baked image {image_node.label} not connected to an output, skipping.\n")
-            
-            # Handle node wrangler / flagged texture nodes
-            elif node.type == "TEX_IMAGE":
-                if node.label in NODE_WRANGLER_TEXTURES or node.label.find(INPUT_PREFIX) == 0:
-                    if node.label in NODE_WRANGLER_TEXTURES:
-                        label = node.label
-                    else:
-                        label = node.label[len(INPUT_PREFIX):]
-                    image_name = unreal_image_name(node.image.name)
-                    if len(node.outputs[0].links) > 0:
-                        socket_type = node.outputs[0].links[0].to_socket.type
-                        if socket_type == "RGBA" or socket_type == "VECTOR":
-                            MaterialMetadata.get_vector(vector_inputs, label).texture_name = image_name
-                        elif socket_type == "VALUE":
-                            MaterialMetadata.get_scalar(scalar_inputs, label).texture_name = image_name
-                        else:
-                           print(f"Skipping image due to invalid output connection: {node.label}\n")
-                    else:
-                        print(f"Image {node.label} not connected to an output, skipping.\n")
-            
-            # Handle flagged color/value constants
-            elif node.type == "RGB" and node.label.find(INPUT_PREFIX) == 0:
-                vector_input = MaterialMetadata.get_vector(vector_inputs, node.label[len(INPUT_PREFIX):]) 
-                vector_input.default = list(node.outputs[0].default_value)
-            
-            elif node.type == "VALUE" and node.label.find(INPUT_PREFIX) == 0:
-                scalar_input = MaterialMetadata.get_scalar(scalar_inputs, node.label[len(INPUT_PREFIX):]) 
-                scalar_input.default = node.outputs[0].default_value
-                
-            elif node.type == "BSDF_PRINCIPLED": # TODO: Just read every input node? Too crowded?
-                if len(node.inputs["Base Color"].links) == 0:
-                    MaterialMetadata.get_vector(vector_inputs, "Base Color").default = list(node.inputs["Base Color"].default_value)
-                if len(node.inputs["Metallic"].links) == 0:
-                    MaterialMetadata.get_scalar(scalar_inputs, "Metallic").default = node.inputs["Metallic"].default_value
-                if len(node.inputs["Roughness"].links) == 0:
-                    MaterialMetadata.get_scalar(scalar_inputs, "Roughness").default = node.inputs["Roughness"].default_value
-                if len(node.inputs["Alpha"].links) == 0:
-                    MaterialMetadata.get_scalar(scalar_inputs, "Alpha").default = node.inputs["Alpha"].default_value
-                if len(node.inputs["Normal"].links) == 0:
-                    MaterialMetadata.get_vector(vector_inputs, "Normal").default = default_vector()
-                if len(node.inputs["Specular IOR Level"].links) == 0:
-                    MaterialMetadata.get_scalar(scalar_inputs, "Specular").default = node.inputs["Specular IOR Level"].default_value
-                if len(node.inputs["Emission Color"].links) == 0:
-                    MaterialMetadata.get_vector(vector_inputs, "Emission").default = list(node.inputs["Emission Color"].default_value)
-                if len(node.inputs["Emission Strength"].links) == 0:
-                    MaterialMetadata.get_scalar(scalar_inputs, "Emission Strength").default = node.inputs["Emission Strength"].default_value
+            handler = NODE_HANDLERS.get(node.type)
+            if handler is None:
+                continue
+            handler(node, node.label, scalar_inputs, vector_inputs, socket_links, tree_cache)
         
         return MaterialMetadata(scalar_inputs, vector_inputs)
+
+# Which metadata input kind a texture feeds, based on the socket type it is connected to
+SOCKET_INPUT_KINDS = {
+    "RGBA" : VectorInputMetadata,
+    "VECTOR" : VectorInputMetadata,
+    "VALUE" : ScalarInputMetadata,
+}
+
+def assign_texture(scalar_inputs : dict[str, ScalarInputMetadata], vector_inputs : dict[str, VectorInputMetadata], socket_type : str, label : str, image_name : str) -> bool:
+    input_kind = SOCKET_INPUT_KINDS.get(socket_type)
+    if input_kind is VectorInputMetadata:
+        MaterialMetadata.get_vector(vector_inputs, label).texture_name = image_name
+    elif input_kind is ScalarInputMetadata:
+        MaterialMetadata.get_scalar(scalar_inputs, label).texture_name = image_name
+    else:
+        return False
+    return True
+
+# Find Ucupaint group
+def handle_group_node(node : bpy.types.ShaderNodeGroup, label : str, scalar_inputs : dict[str, ScalarInputMetadata], vector_inputs : dict[str, VectorInputMetadata], socket_links : dict[bpy.types.NodeSocket, list[bpy.types.NodeSocket]], tree_cache : NodeTreeCache):
+    node_tree = node.node_tree
+    if not get_cached(tree_cache, is_ucupaint_tree, node_tree):
+        return
+    
+    # Handle Ucupaint channels
+    for input in node.inputs:
+        input_type = input.type
+        input_name = input.name
+        input_name = UCUPAINT_CHANNEL_NAMES.get(input_name, input_name)
+        if input_type == "RGBA" or input_type == "VECTOR":
+            MaterialMetadata.get_vector(vector_inputs, input_name).default = tuple(input.default_value)
+        elif input_type == "VALUE":
+            MaterialMetadata.get_scalar(scalar_inputs, input_name).default = input.default_value
+        else:
+            print(f"Skipping input: {input_name}\n")
+    
+    if node_tree.yp.use_baked:
+        # Handle Ucupaint baked images, which are linked inside the group's node tree
+        group_socket_links = get_cached(tree_cache, get_socket_links, node_tree)
+        for channel, image_node in get_cached(tree_cache, get_baked_images, node_tree).items():
+            channel_name = UCUPAINT_CHANNEL_NAMES.get(channel, channel)
+            to_sockets = group_socket_links.get(image_node.outputs[0])
+            if to_sockets:
+                socket_type = to_sockets[0].type
+                image_name = unreal_image_name(image_node.image.name.removeprefix(UCUPAINT_PREFIX))
+                if not assign_texture(scalar_inputs, vector_inputs, socket_type, channel_name, image_name):
+                   print(f"Skipping baked image due to invalid output connection: {image_node.label}\n")
+            else:
+                print(f"Baked image {image_node.label} not connected to an output, skipping.\n")
+
+# Handle node wrangler / flagged texture nodes
+def handle_image_node(node : bpy.types.ShaderNodeTexImage, label : str, scalar_inputs : dict[str, ScalarInputMetadata], vector_inputs : dict[str, VectorInputMetadata], socket_links : dict[bpy.types.NodeSocket, list[bpy.types.NodeSocket]], tree_cache : NodeTreeCache):
+    # Image nodes without an image are skipped, same as when exporting textures
+    image = node.image
+    if image is None:
+        return
     
-DATACLASSES = [
-    MaterialMetadata,
-    VectorInputMetadata,
-    ScalarInputMetadata
-]
- 
-class MetadataEncoder(json.JSONEncoder):
-    def default(self, o):
-        if type(o) in DATACLASSES:
-            return asdict(o)
-        return super().default(o)
+    if label in NODE_WRANGLER_TEXTURES:
+        pass
+    elif label.startswith(INPUT_PREFIX):
+        label = label[INPUT_PREFIX_LEN:]
+    else:
+        return
+    
+    image_name = unreal_image_name(image.name)
+    to_sockets = socket_links.get(node.outputs[0])
+    if to_sockets:
+        socket_type = to_sockets[0].type
+        if not assign_texture(scalar_inputs, vector_inputs, socket_type, label, image_name):
+           print(f"Skipping image due to invalid output connection: {node.label}\n")
+    else:
+        print(f"Image {node.label} not connected to an output, skipping.\n")
+
+# Handle flagged color constants
+def handle_rgb_node(node : bpy.types.ShaderNodeRGB, label : str, scalar_inputs : dict[str, ScalarInputMetadata], vector_inputs : dict[str, VectorInputMetadata], socket_links : dict[bpy.types.NodeSocket, list[bpy.types.NodeSocket]], tree_cache : NodeTreeCache):
+    if label.startswith(INPUT_PREFIX):
+        vector_input = MaterialMetadata.get_vector(vector_inputs, label[INPUT_PREFIX_LEN:]) 
+        vector_input.default = tuple(node.outputs[0].default_value)
+
+# Handle flagged value constants
+def handle_value_node(node : bpy.types.ShaderNodeValue, label : str, scalar_inputs : dict[str, ScalarInputMetadata], vector_inputs : dict[str, VectorInputMetadata], socket_links : dict[bpy.types.NodeSocket, list[bpy.types.NodeSocket]], tree_cache : NodeTreeCache):
+    if label.startswith(INPUT_PREFIX):
+        scalar_input = MaterialMetadata.get_scalar(scalar_inputs, label[INPUT_PREFIX_LEN:]) 
+        scalar_input.default = node.outputs[0].default_value
+
+# Unconnected Principled BSDF inputs to record as (socket name, input kind, metadata label, read socket default).
+# Sockets are looked up by name, since their indices differ between blender versions.
+# The normal socket default is not meaningful, so it is recorded as a zero vector instead.
+# TODO: Just read every input node? Too crowded?
+PRINCIPLED_INPUTS = (
+    ("Base Color", VectorInputMetadata, "Base Color", True),
+    ("Metallic", ScalarInputMetadata, "Metallic", True),
+    ("Roughness", ScalarInputMetadata, "Roughness", True),
+    ("Alpha", ScalarInputMetadata, "Alpha", True),
+    ("Normal", VectorInputMetadata, "Normal", False),
+    ("Specular IOR Level", ScalarInputMetadata, "Specular", True),
+    ("Emission Color", VectorInputMetadata, "Emission", True),
+    ("Emission Strength", ScalarInputMetadata, "Emission Strength", True),
+)
+
+def handle_principled_node(node : bpy.types.ShaderNodeBsdfPrincipled, label : str, scalar_inputs : dict[str, ScalarInputMetadata], vector_inputs : dict[str, VectorInputMetadata], socket_links : dict[bpy.types.NodeSocket, list[bpy.types.NodeSocket]], tree_cache : NodeTreeCache):
+    inputs = node.inputs
+    for socket_name, input_kind, input_label, read_default in PRINCIPLED_INPUTS:
+        socket = inputs[socket_name]
+        if socket.is_linked:
+            continue
+        if input_kind is VectorInputMetadata:
+            MaterialMetadata.get_vector(vector_inputs, input_label).default = tuple(socket.default_value) if read_default else default_vector()
+        else:
+            MaterialMetadata.get_scalar(scalar_inputs, input_label).default = socket.default_value
+
+NODE_HANDLERS = {
+    "GROUP" : handle_group_node,
+    "TEX_IMAGE" : handle_image_node,
+    "RGB" : handle_rgb_node,
+    "VALUE" : handle_value_node,
+    "BSDF_PRINCIPLED" : handle_principled_node,
+}
+    
+def dumps_metadata(metadata : dict[str, Any]) -> str:
+    # Stored in a string ID property rather than a file, so non-ascii output is fine here
+    if orjson:
+        return orjson.dumps(metadata).decode()
+    return json.dumps(metadata)
 
 def get_mesh_objs() -> list[bpy.types.Object]:
-    return [obj for obj in bpy.data.collections['Export'].objects if obj.type == "MESH"]
+    # Object.type can't be read with foreach_get, so filter in python
+    export_collection = bpy.data.collections.get(ToolInfo.EXPORT_COLLECTION.value)
+    if export_collection is None:
+        return []
+    return [obj for obj in export_collection.objects if obj.type == BlenderTypes.MESH]
 
 def get_empty_metadata() -> dict[str, Any]:
     return {
         "materials" : {}
     }
 
-def assign_custom_metadata():
+def assign_custom_metadata(mesh_objs : list[bpy.types.Object] = None):
+    if mesh_objs is None:
+        mesh_objs = get_mesh_objs()
+    
     obj_dict = {}
     empty_dict = {}
     
-    for obj in get_mesh_objs():
+    tree_cache : NodeTreeCache = {}
+    
+    # Materials are commonly shared between meshes, so only walk each node tree once.
+    # Each material is converted to a plain dict here, so serialization needs no dataclass handling.
+    material_cache : dict[str, dict[str, Any]] = {}
+    
+    for obj in mesh_objs:
         metadata = get_empty_metadata()
         
-        for i in range(len(obj.material_slots)):
-            material = obj.material_slots[i].material
+        for material in [slot.material for slot in obj.material_slots if slot.material is not None]:
             fix_material_name(material)
-            metadata["materials"][material.name] = MaterialMetadata.create_material_metadata(material)
+            material_metadata = material_cache.get(material.name_full)
+            if material_metadata is None:
+                material_metadata = MaterialMetadata.create_material_metadata(material, tree_cache).to_dict()
+                material_cache[material.name_full] = material_metadata
+            metadata["materials"][material.name] = material_metadata
         
         obj_dict[obj] = metadata
-        
-        # Handle possible combine meshes option
-        # Send2ue uses immediate parent empties to group meshes into separate files, if combine meshes is enabled.
-        # However, unreal's "combine mesh" import option keeps only one mesh's metadata.
-        # Therefore, we need to combine all children's metadata and set it on each child.
-        # Results in redundancies, but only way to get around this.
-        
+    
+    # Handle possible combine meshes option
+    # Send2ue uses immediate parent empties to group meshes into separate files, if combine meshes is enabled.
+    # However, unreal's "combine mesh" import option keeps only one mesh's metadata.
+    # Therefore, we need to combine all children's metadata and set it on each child.
+    # Results in redundancies, but only way to get around this.
+    parent_dict = {}
+    for obj, metadata in obj_dict.items():
         parent = get_highest_ancestor(obj)
         
         if parent and parent.type in ["EMPTY", "ARMATURE"]:
+            parent_dict[obj] = parent
             if parent not in empty_dict:
                 empty_dict[parent] = get_empty_metadata()
             for key, value in empty_dict[parent].items():
                 if isinstance(value, dict):
-                    empty_dict[parent][key] = empty_dict[parent][key] | metadata[key]
-                    
+                    value.update(metadata[key])
+    
+    # Children of the same empty share one combined metadata dict, so only serialize it once
+    json_cache : dict[int, str] = {}
+    
     for obj, data in obj_dict.items():
         metadata = data
-        parent = get_highest_ancestor(obj)
-        if parent and parent.type in ["EMPTY", "ARMATURE"] and parent in empty_dict:
-            metadata = empty_dict[parent]
-        obj[METADATA_NAME] = json.dumps(metadata, cls = MetadataEncoder)
+        if obj in parent_dict:
+            metadata = empty_dict[parent_dict[obj]]
+        metadata_json = json_cache.get(id(metadata))
+        if metadata_json is None:
+            metadata_json = dumps_metadata(metadata)
+            json_cache[id(metadata)] = metadata_json
+        obj[METADATA_NAME] = metadata_json
+    
 
 def get_highest_ancestor(obj : bpy.types.Object):
     parent = obj.parent
@@ -225,6 +339,9 @@ def get_highest_ancestor(obj : bpy.types.Object):
         parent = parent.parent
     return parent
 
-def delete_custom_metadata():
-    for obj in get_mesh_objs():
+def delete_custom_metadata(mesh_objs : list[bpy.types.Object] = None):
+    if mesh_objs is None:
+        mesh_objs = get_mesh_objs()
+    
+    for obj in mesh_objs:
         del obj[METADATA_NAME]
\ No newline at end of file
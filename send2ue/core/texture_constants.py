@@ -1,6 +1,8 @@
 INPUT_PREFIX = "Param_"
 UCUPAINT_TITLE = "Ucupaint"
-NODE_WRANGLER_TEXTURES = [
+UCUPAINT_PREFIX = f"{UCUPAINT_TITLE} "
+BAKED_PREFIX = "Baked "
+NODE_WRANGLER_TEXTURES = frozenset([
     "Base Color",
     "Metallic",
     "Specular",
@@ -13,12 +15,12 @@ NODE_WRANGLER_TEXTURES = [
     "Emission",
     "Alpha",
     "Ambient Occlusion",
-]
+])
 
-UCUPAINT_IGNORE_BAKED = [
+UCUPAINT_IGNORE_BAKED = frozenset([
     "Normal Overlay Only",
     "Normal Displacement"
-]
+])
 
 INVALID_FILENAME_CHARS = "!@#$%^&*()=[]\\:;\"\'<,>./? "
 
@@ -33,4 +35,7 @@ IMAGE_EXTENSIONS = {
     "HDR" : "hdr",
     "TIFF" : "tiff",
     "WEBP" : "webp"
-}
\ No newline at end of file
+}
+
+# File extension suffixes for str.endswith, which accepts a tuple
+IMAGE_EXT_SUFFIXES = tuple(f".{ext}" for ext in IMAGE_EXTENSIONS.values())
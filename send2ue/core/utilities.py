@@ -4,16 +4,24 @@ import os
 import re
 import bpy
 import math
+import functools
 import shutil
 import importlib
 import tempfile
 import base64
+import numpy as np
 from . import settings, formatting
 from ..ui import header_menu
 from ..dependencies import unreal
 from ..constants import BlenderTypes, UnrealTypes, ToolInfo, PreFixToken, PathModes, RegexPresets
 from mathutils import Vector, Quaternion
 
+# orjson is not shipped with blender, so only use it if the user has installed it
+try:
+    import orjson
+except ModuleNotFoundError:
+    orjson = None
+
 
 def track_progress(message='', attribute=''):
     """
@@ -26,7 +34,7 @@ def track_progress(message='', attribute=''):
     def decorator(function):
         def wrapper(*args, **kwargs):
             asset_id = args[0]
-            bpy.app.driver_namespace[ToolInfo.EXECUTION_QUEUE.value].put(
+            bpy.app.driver_namespace[ToolInfo.EXECUTION_QUEUE.value].append(
                 (function, args, kwargs, message, asset_id, attribute)
             )
 
@@ -80,6 +88,19 @@ def get_operator_class_by_bl_idname(bl_idname):
     return getattr(bpy.types, f'{context.upper()}_OT_{name}', None)
 
 
+@functools.lru_cache(maxsize=None)
+def get_fbx_addon_folder_path():
+    """
+    Gets the folder path of the blender FBX addon. Walking the addon modules is slow, so this is
+    only done once rather than for every exported file.
+
+    :return str: The folder path of the io_scene_fbx addon.
+    """
+    import addon_utils
+    addons = {os.path.basename(os.path.dirname(module.__file__)): module.__file__ for module in addon_utils.modules()}
+    return os.path.dirname(addons.get('io_scene_fbx'))
+
+
 def get_lod0_name(asset_name, properties):
     """
     Gets the correct name for lod0.
@@ -205,7 +226,13 @@ def get_custom_property_fcurve_data(action_name):
         for fcurve in action.fcurves:
             if fcurve.data_path.startswith('["') and fcurve.data_path.endswith('"]'):
                 name = fcurve.data_path.strip('["').strip('"]')
-                data[name] = [[(point.co[0] - 1) / frame_rate, point.co[1]] for point in fcurve.keyframe_points]
+                # read all the key frame coordinates in one call. co is float32, so the buffer must be too for
+                # foreach_get to copy it directly. Widening it to float64 afterwards is exact.
+                points = np.empty(len(fcurve.keyframe_points) * 2, dtype=np.float32)
+                fcurve.keyframe_points.foreach_get('co', points)
+                points = points.astype(np.float64).reshape(-1, 2)
+                points[:, 0] = (points[:, 0] - 1) / frame_rate
+                data[name] = points.tolist()
     return data
 
 
@@ -2,7 +2,7 @@
 
 import os
 import bpy
-import queue
+from collections import deque
 import threading
 from .constants import ToolInfo, ExtensionTasks
 from .core import export, utilities, settings, validations, extension
@@ -24,10 +24,10 @@ class Send2Ue(bpy.types.Operator):
         self.max_step = 0
         self.state = {}
 
-        # add execution queue
+        # add execution queue, jobs are only queued and processed on the main thread so no locking is needed
         execution_queue = bpy.app.driver_namespace.get(ToolInfo.EXECUTION_QUEUE.value)
-        if not execution_queue:
-            bpy.app.driver_namespace[ToolInfo.EXECUTION_QUEUE.value] = queue.Queue()
+        if not isinstance(execution_queue, deque):
+            bpy.app.driver_namespace[ToolInfo.EXECUTION_QUEUE.value] = deque()
         self.execution_queue = bpy.app.driver_namespace[ToolInfo.EXECUTION_QUEUE.value]
 
     @staticmethod
@@ -38,20 +38,18 @@ class Send2Ue(bpy.types.Operator):
         if not self.done:
             context.area.tag_redraw()
 
-        if self.execution_queue.empty():
+        if not self.execution_queue:
             self.done = True
 
         if event.type == 'ESC':
             self.escape = True
-            # clears the queue in a thread safe manner
-            with self.execution_queue.mutex:
-                self.execution_queue.queue.clear()
+            self.execution_queue.clear()
 
         if event.type == 'TIMER':
-            if not self.execution_queue.empty():
+            if self.execution_queue:
                 try:
-                    function, args, kwargs, message, asset_id, attribute = self.execution_queue.get()
-                    step = self.max_step - self.execution_queue.qsize()
+                    function, args, kwargs, message, asset_id, attribute = self.execution_queue.popleft()
+                    step = self.max_step - len(self.execution_queue)
                     context.window_manager.send2ue.progress = abs(((step / self.max_step) * 100) - 1)
                     utilities.refresh_all_areas()
 
@@ -90,7 +88,7 @@ class Send2Ue(bpy.types.Operator):
             self.pre_operation()
 
             # initialize the progress bar
-            self.execution_queue.queue.clear()
+            self.execution_queue.clear()
             context.window_manager.send2ue.progress = 0
             bpy.context.workspace.status_text_set_internal('Validating...')
 
@@ -107,7 +105,7 @@ class Send2Ue(bpy.types.Operator):
                 self.report({'ERROR'}, str(error))
                 return {'FINISHED'}
 
-            self.max_step = self.execution_queue.qsize()
+            self.max_step = len(self.execution_queue)
 
             # start a timer in the operators modal that processes the queued jobs
             context.window_manager.modal_handler_add(self)
@@ -123,12 +121,12 @@ class Send2Ue(bpy.types.Operator):
             properties = bpy.context.scene.send2ue
             self.pre_operation()
 
-            self.execution_queue.queue.clear()
+            self.execution_queue.clear()
             export.send2ue(properties)
 
             # process the queued functions
-            while not self.execution_queue.empty():
-                function, args, kwargs, message, asset_id, attribute = self.execution_queue.get()
+            while self.execution_queue:
+                function, args, kwargs, message, asset_id, attribute = self.execution_queue.popleft()
                 # set the current asset id
                 context.window_manager.send2ue.asset_id = asset_id
                 # run the function